@@ -1,10 +1,8 @@
 import json
-import threading
+import random
 import time
 from typing import Optional, Dict, Any
-import urllib.request
-import urllib.parse
-from urllib.error import URLError, HTTPError
+from weakref import WeakKeyDictionary
 
 from UM.Extension import Extension
 from UM.Application import Application
@@ -12,18 +10,54 @@ from UM.Logger import Logger
 from UM.Signal import signalemitter
 from UM.i18n import i18nCatalog
 
+# Cura 5 (SDK 8.x) always ships PyQt6, so there is no binding to probe for
+from PyQt6.QtCore import QTimer, QObject, QUrl, pyqtSignal
+from PyQt6.QtNetwork import QNetworkAccessManager, QNetworkReply, QNetworkRequest
+
 try:
-    from PyQt6.QtCore import QTimer, QObject, pyqtSignal
+    import orjson
+    _dumps = orjson.dumps
 except ImportError:
-    try:
-        from PyQt5.QtCore import QTimer, QObject, pyqtSignal
-    except ImportError:
-        from UM.Qt.QtCore import QTimer, QObject, pyqtSignal
+    def _dumps(obj: Any) -> bytes:
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
 
 from cura.CuraApplication import CuraApplication
 
 i18n_catalog = i18nCatalog("cura")
 
+_HEADERS = (
+    (b'Content-Type', b'application/json'),
+    (b'User-Agent', b'Cura-WebhookProgressPlugin/1.0.0')
+)
+_TIMEOUT_MS = 10000
+# progress_update is by far the most frequent event, so its body is formatted directly
+# instead of going through a dict and the JSON serializer
+_PROGRESS_TEMPLATE = (
+    b'{"event_type":"progress_update","data":{"job_name":%b,"progress_percent":%d,'
+    b'"elapsed_time_seconds":%.3f,"estimated_remaining_seconds":%.3f,"timestamp":%.3f},'
+    b'"plugin_version":"1.0.0"}'
+)
+# Backoff before each retry of a failed start/end event; jitter is added on top
+_RETRY_DELAYS_MS = (200, 600)
+_RETRY_JITTER_MS = 100
+# After this many consecutive failures progress updates are suppressed for a cool-down that
+# starts at 30 s and doubles with every further failure, up to 5 minutes
+_BREAKER_THRESHOLD = 3
+_BREAKER_BASE_COOLDOWN = 30.0
+_BREAKER_MAX_COOLDOWN = 300.0
+# Progress updates beyond this many requests in flight are dropped so a stalled endpoint
+# can't pile up sends
+_MAX_IN_FLIGHT = 4
+
+
+def _build_request(url: QUrl) -> QNetworkRequest:
+    """Create the webhook request with its fixed headers and timeout."""
+    request = QNetworkRequest(url)
+    for name, value in _HEADERS:
+        request.setRawHeader(name, value)
+    request.setTransferTimeout(_TIMEOUT_MS)
+    return request
+
 
 @signalemitter
 class WebhookProgressPlugin(Extension, QObject):
@@ -32,22 +66,52 @@ class WebhookProgressPlugin(Extension, QObject):
         
         self._application = CuraApplication.getInstance()
         self._webhook_url = ""
+        self._webhook_qurl = QUrl()
+        # Prebuilt request (URL, headers, timeout); post() copies it, so one instance serves every send
+        self._webhook_request = QNetworkRequest()
         self._last_progress = -1
         self._is_printing = False
         self._current_job_name = ""
+        self._job_name_json = b'""'
         self._print_start_time = 0
+        self._print_start_monotonic = 0.0
+        # Device attributes resolved once when the device is first seen
+        self._dev_caps = WeakKeyDictionary()  # type: WeakKeyDictionary[Any, Dict[str, bool]]
+        # True while every connected device reports progress through signals
+        self._signal_path_active = False
+        # Requests are sent asynchronously on the Qt event loop, reusing keep-alive connections
+        self._nam = None  # type: Optional[QNetworkAccessManager]
+        self._in_flight = 0
+        self._failure_count = 0
+        self._cooldown_until = 0.0
+        # Latest progress body held back so bursts of ticks coalesce into one POST
+        self._pending_progress = None  # type: Optional[bytes]
+        self._flush_scheduled = False
+
+        # Polling is only a fallback for devices without progress signals; the
+        # timer is single-shot and re-armed by _check_print_progress itself.
         self._check_timer = QTimer()
         self._check_timer.timeout.connect(self._check_print_progress)
-        self._check_timer.setSingleShot(False)
+        self._check_timer.setSingleShot(True)
         
+        # Everything else waits until Cura has finished starting up
+        self._application.initializationFinished.connect(self._deferred_init)
+
+    def _deferred_init(self) -> None:
+        """Load settings and wire up signals once Cura and its output devices are ready."""
         # Settings for webhook URL (you can extend this to use Cura's preferences system)
         self._load_settings()
         
+        self._nam = QNetworkAccessManager(self)
+        
         # Connect to printer output device manager
         self._application.getMachineManager().printerOutputDevicesChanged.connect(self._on_printer_output_devices_changed)
         
-        # Start monitoring timer (check every 5 seconds)
-        self._check_timer.start(5000)
+        # Stop sending when Cura exits
+        self._application.applicationShuttingDown.connect(self._on_application_shutting_down)
+        
+        # Bind signals on devices that are already present
+        self._on_printer_output_devices_changed()
         
         Logger.log("i", "WebhookProgressPlugin initialized")
 
@@ -57,6 +121,8 @@ class WebhookProgressPlugin(Extension, QObject):
         # TODO: Implement proper settings dialog
         # For now, set your webhook URL here:
         self._webhook_url = "https://api.automaddie.co/webhook/cura-updater"
+        self._webhook_qurl = QUrl(self._webhook_url)
+        self._webhook_request = _build_request(self._webhook_qurl)
         
         if not self._webhook_url:
             Logger.log("w", "No webhook URL configured for WebhookProgressPlugin. Please update the URL in WebhookProgressPlugin.py")
@@ -65,16 +131,70 @@ class WebhookProgressPlugin(Extension, QObject):
         """Called when printer output devices change."""
         output_devices = self._application.getMachineManager().printerOutputDevices
         
+        # Release devices that went away, so a device that comes back is connected exactly once
+        current = set(output_devices)
+        for device in list(self._dev_caps.keys()):
+            if device not in current:
+                self._disconnect_device(device)
+                del self._dev_caps[device]
+        
+        needs_polling = False
         for device in output_devices:
+            caps = self._dev_caps.get(device)
+            if caps is None:
+                # Only flags are cached: bound signals would keep the device alive
+                caps = {
+                    "progress": hasattr(device, 'printProgressChanged'),
+                    "job": hasattr(device, 'printJobChanged'),
+                    "state": hasattr(device, 'connectionStateChanged'),
+                    "active_job": hasattr(device, 'activePrintJob'),
+                    "print_progress": hasattr(device, 'printProgress')
+                }
+                try:
+                    if caps["job"]:
+                        device.printJobChanged.connect(self._on_print_job_changed)
+                    if caps["progress"]:
+                        device.printProgressChanged.connect(self._on_print_progress_changed)
+                    if caps["state"]:
+                        device.connectionStateChanged.connect(self._on_connection_state_changed)
+                except Exception as e:
+                    Logger.log("w", f"Could not connect to device signals: {e}")
+                    # Without a working progress signal this device has to be polled
+                    caps["progress"] = False
+                self._dev_caps[device] = caps
+            if not (caps["progress"] and caps["job"]):
+                # Without both signals the job start/end or progress has to be polled
+                needs_polling = True
+
+        self._signal_path_active = bool(output_devices) and not needs_polling
+        if needs_polling:
+            # Fall back to polling every 5 seconds
+            if not self._check_timer.isActive():
+                self._check_timer.start(5000)
+        else:
+            # Every device is covered by signals (or there are none), so nothing to poll
+            self._check_timer.stop()
+
+    def _disconnect_device(self, device) -> None:
+        """Disconnect this plugin's slots from a device's signals."""
+        for signal_name, slot in (
+            ('printJobChanged', self._on_print_job_changed),
+            ('printProgressChanged', self._on_print_progress_changed),
+            ('connectionStateChanged', self._on_connection_state_changed)
+        ):
+            signal = getattr(device, signal_name, None)
+            if signal is None:
+                continue
             try:
-                if hasattr(device, 'printJobChanged'):
-                    device.printJobChanged.connect(self._on_print_job_changed)
-                if hasattr(device, 'printProgressChanged'):
-                    device.printProgressChanged.connect(self._on_print_progress_changed)
-                if hasattr(device, 'connectionStateChanged'):
-                    device.connectionStateChanged.connect(self._on_connection_state_changed)
-            except Exception as e:
-                Logger.log("w", f"Could not connect to device signals: {e}")
+                signal.disconnect(slot)
+            except (TypeError, RuntimeError):
+                # Never connected, or the underlying Qt object is already gone
+                pass
+
+    def _on_application_shutting_down(self) -> None:
+        """Drop held webhooks and stop polling on Cura exit."""
+        self._pending_progress = None
+        self._check_timer.stop()
 
     def _on_connection_state_changed(self, connection_state) -> None:
         """Called when printer connection state changes."""
@@ -85,6 +205,7 @@ class WebhookProgressPlugin(Extension, QObject):
         if job is None:
             self._is_printing = False
             self._current_job_name = ""
+            self._job_name_json = b'""'
             self._last_progress = -1
             self._send_webhook_update("print_ended", {
                 "message": "Print job ended or cancelled",
@@ -93,7 +214,11 @@ class WebhookProgressPlugin(Extension, QObject):
         else:
             self._is_printing = True
             self._current_job_name = job.getName() if hasattr(job, 'getName') else "Unknown"
+            # Escaped once per job for the progress template
+            self._job_name_json = json.dumps(self._current_job_name).encode('utf-8')
             self._print_start_time = time.time()
+            # Elapsed time is measured on the monotonic clock so wall-clock jumps don't skew ETAs
+            self._print_start_monotonic = time.monotonic()
             self._last_progress = 0
             
             self._send_webhook_update("print_started", {
@@ -113,28 +238,36 @@ class WebhookProgressPlugin(Extension, QObject):
         if progress_percent > self._last_progress:
             self._last_progress = progress_percent
             
-            elapsed_time = time.time() - self._print_start_time
-            estimated_total = elapsed_time / (progress if progress > 0 else 0.01)
-            estimated_remaining = estimated_total - elapsed_time
+            elapsed_time = time.monotonic() - self._print_start_monotonic
+            # progress is at least 0.01 here, since the 1% gate starts from 0
+            estimated_remaining = elapsed_time / progress - elapsed_time
             
-            self._send_webhook_update("progress_update", {
-                "job_name": self._current_job_name,
-                "progress_percent": progress_percent,
-                "elapsed_time_seconds": elapsed_time,
-                "estimated_remaining_seconds": estimated_remaining,
-                "timestamp": time.time()
-            })
+            self._send_progress_update(_PROGRESS_TEMPLATE % (
+                self._job_name_json,
+                progress_percent,
+                elapsed_time,
+                estimated_remaining,
+                time.time()
+            ))
 
     def _check_print_progress(self) -> None:
-        """Periodically check print progress from connected devices."""
-        if not self._webhook_url:
+        """Poll print progress from devices that lack progress signals."""
+        if self._signal_path_active:
             return
             
         try:
             output_devices = self._application.getMachineManager().printerOutputDevices
+            # Without a URL there's nothing to send, but keep the poll chain alive
+            # so it resumes once one is set
+            if not self._webhook_url:
+                return
             
             for device in output_devices:
-                if hasattr(device, 'activePrintJob'):
+                caps = self._dev_caps.get(device)
+                if caps is None or (caps["progress"] and caps["job"]):
+                    # Unknown device, or its job and progress already arrive via signals
+                    continue
+                if caps["active_job"]:
                     job = device.activePrintJob
                     if job is not None:
                         if not self._is_printing:
@@ -145,7 +278,7 @@ class WebhookProgressPlugin(Extension, QObject):
                         progress = 0.0
                         if hasattr(job, 'getProgress'):
                             progress = job.getProgress()
-                        elif hasattr(device, 'printProgress'):
+                        elif caps["print_progress"]:
                             progress = device.printProgress
                         
                         if progress is not None:
@@ -155,10 +288,16 @@ class WebhookProgressPlugin(Extension, QObject):
                         self._on_print_job_changed(None)
         except Exception as e:
             Logger.log("e", f"Error checking print progress: {e}")
+        finally:
+            # Decided from the capability cache so a failure above can't end the poll chain
+            if not self._signal_path_active and any(
+                not (caps["progress"] and caps["job"]) for caps in self._dev_caps.values()
+            ):
+                self._check_timer.start(5000)
 
     def _send_webhook_update(self, event_type: str, data: Dict[str, Any]) -> None:
-        """Send update to webhook URL."""
-        if not self._webhook_url:
+        """Send update to webhook URL. The payload is serialized here, on the calling thread."""
+        if not self._webhook_qurl.host():
             Logger.log("w", "Webhook URL not configured, skipping update")
             return
             
@@ -168,39 +307,90 @@ class WebhookProgressPlugin(Extension, QObject):
             "plugin_version": "1.0.0"
         }
         
-        # Send in separate thread to avoid blocking UI
-        thread = threading.Thread(target=self._send_webhook_request, args=(payload,))
-        thread.daemon = True
-        thread.start()
+        body = _dumps(payload)
 
-    def _send_webhook_request(self, payload: Dict[str, Any]) -> None:
-        """Send HTTP request to webhook URL."""
-        try:
-            json_data = json.dumps(payload).encode('utf-8')
-            
-            req = urllib.request.Request(
-                self._webhook_url,
-                data=json_data,
-                headers={
-                    'Content-Type': 'application/json',
-                    'User-Agent': 'Cura-WebhookProgressPlugin/1.0.0'
-                }
-            )
-            
-            with urllib.request.urlopen(req, timeout=10) as response:
-                if response.getcode() == 200:
-                    Logger.log("d", f"Webhook update sent successfully: {payload['event_type']}")
-                else:
-                    Logger.log("w", f"Webhook returned status {response.getcode()}")
-                    
-        except HTTPError as e:
-            Logger.log("e", f"HTTP error sending webhook: {e.code} - {e.reason}")
-        except URLError as e:
-            Logger.log("e", f"URL error sending webhook: {e.reason}")
-        except Exception as e:
-            Logger.log("e", f"Unexpected error sending webhook: {str(e)}")
+        # Start/end events bypass coalescing; flush held progress first to keep ordering
+        self._flush()
+        self._submit(body, event_type)
+
+    def _send_progress_update(self, body: bytes) -> None:
+        """Hold a serialized progress update briefly so only the latest is sent."""
+        if not self._webhook_qurl.host():
+            Logger.log("w", "Webhook URL not configured, skipping update")
+            return
+        # Only progress is suppressed by the circuit breaker; start/end events are always sent
+        if time.monotonic() < self._cooldown_until:
+            return
+
+        self._pending_progress = body
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            QTimer.singleShot(500, self._flush)
+
+    def _flush(self) -> None:
+        """Send the held progress update, if any."""
+        self._flush_scheduled = False
+        body, self._pending_progress = self._pending_progress, None
+        if body is not None:
+            self._submit(body, "progress_update")
+
+    def _submit(self, body: bytes, event_type: str, attempt: int = 0) -> None:
+        """Post a JSON body through Qt's network stack without blocking the UI."""
+        # Start/end events can't be rebuilt from a later tick, so only progress is capped
+        if event_type == "progress_update" and self._in_flight >= _MAX_IN_FLIGHT:
+            Logger.log("w", f"Dropping webhook {event_type}, too many requests in flight")
+            return
+
+        reply = self._nam.post(self._webhook_request, body)
+        self._in_flight += 1
+        reply.finished.connect(lambda: self._on_reply_finished(reply, body, event_type, attempt))
+
+    def _on_reply_finished(self, reply: QNetworkReply, body: bytes, event_type: str, attempt: int) -> None:
+        """Log the outcome of a webhook request, retry it if needed and release its reply."""
+        self._in_flight -= 1
+        status = reply.attribute(QNetworkRequest.Attribute.HttpStatusCodeAttribute)
+
+        if reply.error() != QNetworkReply.NetworkError.NoError:
+            # Only start/end events are retried; a failed progress update is superseded by the next tick
+            transient = status is None or status >= 500
+            if transient and event_type != "progress_update" and attempt < len(_RETRY_DELAYS_MS):
+                delay = _RETRY_DELAYS_MS[attempt] + random.randint(0, _RETRY_JITTER_MS)
+                Logger.log("w", f"Error sending webhook {event_type}, retrying in {delay} ms: {reply.errorString()}")
+                QTimer.singleShot(delay, lambda: self._submit(body, event_type, attempt + 1))
+            else:
+                # Counted once per send, after its last attempt, so retries don't trip the breaker
+                self._record_failure()
+                Logger.log("e", f"Error sending webhook: {reply.errorString()}")
+        elif status is not None and 200 <= status < 300:
+            self._failure_count = 0
+            Logger.log("d", f"Webhook update sent successfully: {event_type}")
+        else:
+            Logger.log("w", f"Webhook returned status {status}")
+
+        reply.deleteLater()
+
+    def _record_failure(self) -> None:
+        """Count a failed request and open the circuit breaker if the endpoint keeps failing."""
+        if time.monotonic() < self._cooldown_until:
+            # Requests posted before the breaker opened are still failing; only a send
+            # made after the cool-down ended may escalate it
+            return
+        self._failure_count += 1
+        if self._failure_count < _BREAKER_THRESHOLD:
+            return
+        doublings = min(self._failure_count - _BREAKER_THRESHOLD, 4)
+        cooldown = min(_BREAKER_MAX_COOLDOWN, _BREAKER_BASE_COOLDOWN * 2 ** doublings)
+        self._cooldown_until = time.monotonic() + cooldown
+        Logger.log("w", f"Webhook failed {self._failure_count} times in a row, pausing updates for {cooldown:.0f} s")
 
     def setWebhookUrl(self, url: str) -> None:
         """Set the webhook URL (for future settings dialog)."""
         self._webhook_url = url
+        self._webhook_qurl = QUrl(url)
+        self._webhook_request = _build_request(self._webhook_qurl)
+        # A new endpoint gets a fresh start
+        self._failure_count = 0
+        self._cooldown_until = 0.0
+        if url and not self._webhook_qurl.host():
+            Logger.log("w", f"Webhook URL has no host, updates will not be sent: {url}")
         Logger.log("i", f"Webhook URL set to: {url}")